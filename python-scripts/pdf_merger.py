@@ -5,9 +5,14 @@ import csv
 import argparse
 import sys
 import logging
+import multiprocessing
+import zipfile
+from xml.etree import ElementTree
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime
 from pathlib import Path
-from collections import defaultdict
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from pdf_optimizer import PDFOptimizer
 
 # For Excel file reading
@@ -21,6 +26,47 @@ except ImportError:
     except ImportError:
         EXCEL_AVAILABLE = False
 
+# For fast parsing of large .xlsx EDI files (falls back to openpyxl)
+try:
+    from python_calamine import CalamineWorkbook
+    CALAMINE_AVAILABLE = True
+except ImportError:
+    CALAMINE_AVAILABLE = False
+
+# For multi-reference text search (falls back to a regex alternation)
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+# Client references: 000-000-000 / 000/000/000 in filenames, and additionally
+# 000 000 000 in page text
+FILENAME_REF_PATTERN = re.compile(r'(\d{3}[-/]\d{3}[-/]\d{3})')
+REF_PATTERN = re.compile(r'(\d{3})(?:[-/]|\s+)(\d{3})(?:[-/]|\s+)(\d{3})')
+
+# Characters not allowed in output filenames
+UNSAFE_FILENAME_PATTERN = re.compile(r'[<>:"/\\|?*]')
+
+# Reference and keyword matching only needs the raw characters, so skip
+# ligature/whitespace preservation but keep text outside the page clipped
+TEXT_FLAGS = fitz.TEXT_MEDIABOX_CLIP
+
+# .xlsx EDI files above this size are read with calamine when available
+CALAMINE_MIN_BYTES = 10 * 1024 * 1024
+
+# Tax-relevant keywords flagged on pages after the manifest section
+TAX_KEYWORDS = ['tools', 'alcohol', 'new']
+TAX_KEYWORD_PATTERN = re.compile('|'.join(map(re.escape, TAX_KEYWORDS)), re.IGNORECASE)
+
+# Documents with at most this many pages after page 12 are only tax-scanned
+# when page 13 has real text (not just continuation boilerplate)
+TAX_SCAN_SHORT_TAIL_PAGES = 3
+TAX_SCAN_MIN_TEXT_CHARS = 200
+
+# Source PDFs kept open at once; pages are stored by path and reopened on demand
+MAX_OPEN_DOCS = 8
+
 def setup_logging(job_id=None):
     """Set up simple logging for PDF merger"""
     
@@ -54,9 +100,66 @@ def setup_logging(job_id=None):
     
     return logger
 
+def _xlsx_active_sheet_index(xlsx_path):
+    """Index of the sheet an .xlsx workbook was saved with active (openpyxl's workbook.active)"""
+    with zipfile.ZipFile(xlsx_path) as archive:
+        workbook_xml = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    namespace = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+    view = workbook_xml.find(f'{namespace}bookViews/{namespace}workbookView')
+    return int(view.get('activeTab', 0)) if view is not None else 0
+
+def page_runs(pages):
+    """Group (pdf_path, page_num) pages into (pdf_path, from_page, to_page) runs of consecutive source pages"""
+    run = None
+    for pdf_path, page_num in pages:
+        if run and run[0] == pdf_path and run[2] == page_num - 1:
+            run[2] = page_num
+            continue
+        if run:
+            yield tuple(run)
+        run = [pdf_path, page_num, page_num]
+    if run:
+        yield tuple(run)
+
+# This worker process's copy of the PDFMerger, set by _init_merge_worker
+_worker_merger = None
+
+def _init_merge_worker(merger, log_queue, log_level):
+    """Process pool initializer for client merges"""
+    global _worker_merger
+    _worker_merger = merger
+    # Spawned workers start without logging configured; send their records
+    # to the parent's handlers
+    root_logger = logging.getLogger()
+    root_logger.addHandler(QueueHandler(log_queue))
+    root_logger.setLevel(log_level)
+
+def _merge_client_worker(client_key, client_data):
+    """Merge one client in a worker process; report entries are returned to the parent"""
+    merger = _worker_merger
+    merger.compression_report = []
+    merger.tax_alerts = []
+    success = merger.merge_client_documents(client_key, client_data)
+    merger._close_source_docs()
+    return success, merger.compression_report, merger.tax_alerts
+
+class ClientRecord:
+    """Collected (reference, name) info and (pdf_path, page_num) source pages for one client"""
+    __slots__ = ('info', 'advice', 'bill', 'customer')
+
+    def __init__(self):
+        self.info = None
+        # Source pages by document type, in merge order
+        self.advice = []
+        self.bill = []
+        self.customer = []
+
+    def has_pages(self):
+        return bool(self.advice or self.bill or self.customer)
+
 class PDFMerger:
     def __init__(self, input_folder, output_folder, reference_doc=None, edi_file=None, 
-                 enable_optimization=True, target_size_mb=1.2):
+                 enable_optimization=True, target_size_mb=1.2, header_clip=None, max_workers=1):
         # Add logging
         self.logger = logging.getLogger('PDFMerger')
         self.logger.info(f"Initializing PDF Merger: {input_folder} -> {output_folder}")
@@ -65,11 +168,27 @@ class PDFMerger:
         self.input_folder = Path(input_folder)
         self.output_folder = Path(output_folder)
         self.output_folder.mkdir(exist_ok=True)
-        self.clients = defaultdict(lambda: {'info': None, 'pages': []})
+        self.clients = {}
         self.manifest = {}
+        # Slash- and dash-form references -> (EDI reference, name)
+        self._manifest_index = {}
+        self._manifest_pattern = None
+        # First 11 characters ("000/527/962") -> EDI reference
+        self._manifest_prefix = {}
+        # Extracted page text keyed by (pdf_path, page_num); cleared after merging
+        self._text_cache = {}
+        # Least recently used source documents, keyed by path
+        self._open_docs = OrderedDict()
         self.reference_doc = reference_doc
         self.edi_file = edi_file
         
+        # Optional (x0, y0, x1, y1) page region holding the client reference on
+        # Advice/Bill templates; when unset the first few text blocks are used
+        self.header_clip = fitz.Rect(header_clip) if header_clip else None
+        
+        # Worker processes used to merge clients (1 merges in this process)
+        self.max_workers = max_workers or 1
+        
         # Add optimization settings
         self.enable_optimization = enable_optimization
         self.target_size_mb = target_size_mb
@@ -139,43 +258,58 @@ class PDFMerger:
                             # For EDI files, trust the data completely - no validation
                             if ref_clean and name_clean and ref_clean != 'nan' and name_clean != 'nan':
                                 manifest_data[ref_clean] = name_clean
-                                self.logger.debug(f"Added EDI entry: {ref_clean} -> {name_clean}")
+                                self.logger.debug("Added EDI entry: %s -> %s", ref_clean, name_clean)
 
             else:
-                # Use openpyxl for .xlsx files
-                from openpyxl import load_workbook
-                workbook = load_workbook(edi_path)
-                sheet = workbook.active
-
-                # Read data starting from row 2 (skip header row 1)
-                for row in sheet.iter_rows(min_row=2, values_only=True):
-                    if len(row) > 11:  # Ensure we have enough columns
-                        consignee_name = row[6]  # Column 6: "Consignees Name"
-                        consignee_ref = row[11]  # Column 11: "Consignees Reference"
-
-                        if consignee_ref and consignee_name:
-                            # Clean up the reference format
-                            ref_clean = str(consignee_ref).strip()
-                            name_clean = str(consignee_name).strip()
-
-                            # For EDI files, trust the data completely - no validation
-                            if ref_clean and name_clean and ref_clean != 'nan' and name_clean != 'nan':
-                                manifest_data[ref_clean] = name_clean
-                                self.logger.debug(f"Added EDI entry: {ref_clean} -> {name_clean}")
+                if CALAMINE_AVAILABLE and edi_path.stat().st_size > CALAMINE_MIN_BYTES:
+                    # Large .xlsx files parse far faster in calamine (Rust) than in
+                    # openpyxl's Python XML reader; read the active sheet, as openpyxl does
+                    workbook = None
+                    sheet = CalamineWorkbook.from_path(str(edi_path)).get_sheet_by_index(
+                        _xlsx_active_sheet_index(edi_path))
+                    rows = sheet.to_python()[1:]  # Skip header row
+                else:
+                    # Use openpyxl for .xlsx files (read-only streams rows instead of
+                    # building the whole workbook in memory)
+                    from openpyxl import load_workbook
+                    workbook = load_workbook(edi_path, read_only=True, data_only=True, keep_links=False)
+                    sheet = workbook.active
+
+                    # Read data starting from row 2 (skip header row 1); only the
+                    # first 12 columns are used
+                    rows = sheet.iter_rows(min_row=2, max_col=12, values_only=True)
+
+                try:
+                    for row in rows:
+                        if len(row) > 11:  # Ensure we have enough columns
+                            consignee_name = row[6]  # Column 6: "Consignees Name"
+                            consignee_ref = row[11]  # Column 11: "Consignees Reference"
+
+                            if consignee_ref and consignee_name:
+                                # Clean up the reference format
+                                ref_clean = str(consignee_ref).strip()
+                                name_clean = str(consignee_name).strip()
+
+                                # For EDI files, trust the data completely - no validation
+                                if ref_clean and name_clean and ref_clean != 'nan' and name_clean != 'nan':
+                                    manifest_data[ref_clean] = name_clean
+                                    self.logger.debug("Added EDI entry: %s -> %s", ref_clean, name_clean)
+                finally:
+                    if workbook is not None:
+                        workbook.close()
 
             # Create CSV file
             csv_path = "client_manifest.csv"
             with open(csv_path, 'w', newline='', encoding='utf-8') as csvfile:
                 writer = csv.writer(csvfile)
                 writer.writerow(['ConsigneeRef', 'FullName'])
-
-                for ref, name in sorted(manifest_data.items()):
-                    writer.writerow([ref, name])
+                writer.writerows(sorted(manifest_data.items()))
 
             self.logger.info(f"Created manifest CSV with {len(manifest_data)} clients: {csv_path}")
 
             # Load the created manifest into memory
             self.manifest = manifest_data
+            self._build_manifest_index()
 
         except Exception as e:
             self.logger.error(f"Error creating manifest from EDI file: {e}")
@@ -198,21 +332,62 @@ class PDFMerger:
                     name = row.get('FullName', '').strip()
                     if ref and name:
                         self.manifest[ref] = name
-                        self.logger.info(f"Loaded client: {ref} -> {name}")
+                        self.logger.info("Loaded client: %s -> %s", ref, name)
             
+            self._build_manifest_index()
             self.logger.info(f"Successfully loaded {len(self.manifest)} clients from manifest")
             
         except Exception as e:
             self.logger.error(f"Failed to load manifest: {e}")
 
-    def scan_for_tax_keywords(self, doc, client_name, client_ref):
+    def _build_manifest_index(self):
+        """Index EDI references by slash/dash form and by their 11-character base"""
+        self._manifest_index = {}
+        self._manifest_prefix = {}
+        for ref, name in self.manifest.items():
+            self._manifest_index[ref] = (ref, name)
+            self._manifest_index[ref.replace('/', '-')] = (ref, name)
+            # First reference wins when several share a base
+            self._manifest_prefix.setdefault(ref[:11], ref)
+        
+        # One matcher over every reference form so document text is scanned
+        # once instead of once per reference (longest match wins so suffixed
+        # references are not shadowed by their shorter base)
+        if not self._manifest_index:
+            self._manifest_pattern = None
+        elif AHOCORASICK_AVAILABLE:
+            automaton = ahocorasick.Automaton()
+            for ref_form in self._manifest_index:
+                automaton.add_word(ref_form, ref_form)
+            automaton.make_automaton()
+            self._manifest_pattern = automaton
+        else:
+            ref_forms = sorted(self._manifest_index, key=len, reverse=True)
+            self._manifest_pattern = re.compile('|'.join(map(re.escape, ref_forms)))
+
+    def _find_manifest_ref_in_text(self, text):
+        """Return (edi_ref, name) for the first EDI reference in text, or None"""
+        if self._manifest_pattern is None:
+            return None
+        
+        if AHOCORASICK_AVAILABLE:
+            for _, ref_form in self._manifest_pattern.iter_long(text):
+                return self._manifest_index[ref_form]
+            return None
+        
+        ref_match = self._manifest_pattern.search(text)
+        return self._manifest_index[ref_match.group(0)] if ref_match else None
+
+    def scan_for_tax_keywords(self, pages, client_name, client_ref):
         """
-        Scan every page after page 12 of a document for tax-relevant keywords
+        Scan every page after page 12 of a merged document for tax-relevant keywords
+
+        pages are the merged document's (pdf_path, page_num) source pages in output order, so
+        text already extracted while matching references is reused
         """
-        tax_keywords = ['tools', 'alcohol', 'new']
         found_keywords = []
 
-        total_pages = len(doc)
+        total_pages = len(pages)
         # Scan all pages after page 12 (manifest section)
         start_page = 12  # Start from page 13 (0-indexed = 12)
 
@@ -220,34 +395,46 @@ class PDFMerger:
             self.logger.debug(f"Document only has {total_pages} pages, skipping tax scan: {client_name}")
             return
 
+        short_tail = total_pages <= start_page + TAX_SCAN_SHORT_TAIL_PAGES
+
         self.logger.debug(f"Scanning pages {start_page + 1}-{total_pages} for tax keywords: {client_name}")
 
         for page_num in range(start_page, total_pages):
             try:
-                page = doc[page_num]
-                text = page.get_text().lower()
-
-                for keyword in tax_keywords:
-                    if keyword in text:
-                        # Find context around the keyword
-                        words = text.split()
-                        for i, word in enumerate(words):
-                            if keyword in word:
-                                # Get 3 words before and after for context
-                                context_start = max(0, i - 3)
-                                context_end = min(len(words), i + 4)
-                                context = ' '.join(words[context_start:context_end])
-
-                                found_keywords.append({
-                                    'keyword': keyword.upper(),
-                                    'page': page_num + 1,
-                                    'context': context.strip()
-                                })
-                                self.logger.info(f"🚨 TAX ALERT: {keyword.upper()} found in {client_name} (Page {page_num + 1})")
-                                break  # Only record first occurrence per page
+                pdf_path, source_page = pages[page_num]
+                text = self._page_text(pdf_path, source_page)
+
+                # One pass over the page finds every keyword occurrence
+                keywords_on_page = set()
+                for match in TAX_KEYWORD_PATTERN.finditer(text):
+                    keyword = match.group(0).lower()
+                    if keyword in keywords_on_page:
+                        continue  # Only record first occurrence per page
+                    keywords_on_page.add(keyword)
+
+                    # Take the surrounding text as context
+                    context_start = max(0, match.start() - 60)
+                    context = ' '.join(text[context_start:match.end() + 60].split())
+
+                    found_keywords.append({
+                        'keyword': keyword.upper(),
+                        'page': page_num + 1,
+                        'context': context
+                    })
+                    self.logger.info("🚨 TAX ALERT: %s found in %s (Page %d)", keyword.upper(), client_name, page_num + 1)
+
+                    if len(keywords_on_page) == len(TAX_KEYWORDS):
+                        break
+
+                # A short tail starting with a near-empty page without keywords is
+                # continuation boilerplate, so skip extracting the remaining pages
+                if (page_num == start_page and short_tail and not keywords_on_page
+                        and len(text.strip()) < TAX_SCAN_MIN_TEXT_CHARS):
+                    self.logger.debug("Page %d is nearly empty, skipping rest of tax scan: %s", start_page + 1, client_name)
+                    break
 
             except Exception as e:
-                self.logger.debug(f"Could not scan page {page_num + 1}: {e}")
+                self.logger.debug("Could not scan page %d: %s", page_num + 1, e)
 
         # Store tax alerts for this client
         if found_keywords:
@@ -257,6 +444,14 @@ class PDFMerger:
                 'alerts': found_keywords
             })
 
+    def _compression_totals(self):
+        """Total original and final sizes (MB) of the compression report in one pass"""
+        total_original = total_final = 0.0
+        for item in self.compression_report:
+            total_original += item['original_size_mb']
+            total_final += item['final_size_mb']
+        return total_original, total_final
+
     def generate_compression_report(self):
         """
         Generate a detailed compression report
@@ -269,8 +464,7 @@ class PDFMerger:
         report.append("📊 PDF COMPRESSION REPORT")
         report.append("=" * 80)
 
-        total_original = sum(item['original_size_mb'] for item in self.compression_report)
-        total_final = sum(item['final_size_mb'] for item in self.compression_report)
+        total_original, total_final = self._compression_totals()
         total_saved = total_original - total_final
 
         report.append(f"📈 SUMMARY:")
@@ -346,71 +540,125 @@ class PDFMerger:
             self.logger.error(f"Failed to save reports: {e}")
             return None, None
 
+    def _client_record(self, client_ref):
+        """Get the record for a client, creating it on first use"""
+        record = self.clients.get(client_ref)
+        if record is None:
+            record = self.clients[client_ref] = ClientRecord()
+        return record
+
+    def _source_doc(self, pdf_path):
+        """Open a source PDF, keeping only the most recently used few open"""
+        doc = self._open_docs.pop(pdf_path, None)
+        if doc is None:
+            doc = fitz.open(pdf_path)
+            if len(self._open_docs) >= MAX_OPEN_DOCS:
+                _, oldest_doc = self._open_docs.popitem(last=False)
+                oldest_doc.close()
+        self._open_docs[pdf_path] = doc
+        return doc
+
+    def _close_source_doc(self, pdf_path):
+        """Close one cached source PDF if it is open"""
+        doc = self._open_docs.pop(pdf_path, None)
+        if doc is not None:
+            doc.close()
+
+    def _close_source_docs(self):
+        """Close every cached source PDF"""
+        for doc in self._open_docs.values():
+            doc.close()
+        self._open_docs.clear()
+
+    def _page_text(self, pdf_path, page_num):
+        """Extract the full text of a page, reusing earlier extractions"""
+        key = (pdf_path, page_num)
+        text = self._text_cache.get(key)
+        if text is None:
+            doc = self._source_doc(pdf_path)
+            text = self._text_cache[key] = doc[page_num].get_text("text", flags=TEXT_FLAGS)
+        return text
+
+    def _page_header_texts(self, doc, pdf_path):
+        """
+        Header text of every page: the header_clip region, or else the first
+        few text blocks (whose joined blocks are cached as the page's full
+        text, so a fallback scan doesn't extract the page again)
+        """
+        if self.header_clip is not None:
+            return [doc[page_num].get_text("text", clip=self.header_clip, flags=TEXT_FLAGS)
+                    for page_num in range(len(doc))]
+        
+        source_path = str(pdf_path)
+        header_texts = []
+        for page_num in range(len(doc)):
+            blocks = doc[page_num].get_text("blocks", sort=False, flags=TEXT_FLAGS)
+            block_texts = [block[4] for block in blocks]
+            header_texts.append(''.join(block_texts[:5]))
+            self._text_cache[(source_path, page_num)] = ''.join(block_texts)
+        return header_texts
+
+    def _match_manifest_ref(self, text):
+        """Return (normalized_ref, edi_ref) for the first manifest reference in text, or None"""
+        for match in REF_PATTERN.finditer(text):
+            # Normalize reference format
+            ref_normalized = '/'.join(match.groups())
+            
+            # ENHANCED: Match on first 11 characters to handle suffix variations
+            edi_ref = self._manifest_prefix.get(ref_normalized[:11])
+            if edi_ref:
+                return ref_normalized, edi_ref  # Only match once per page
+        
+        return None
+
     def process_multi_client_document(self, pdf_path, doc_type):
         """Process multi-client documents (Advice of Arrivals, Bills of Lading)"""
         self.logger.info(f"Processing {doc_type}: {pdf_path.name}")
         
         try:
-            doc = fitz.open(pdf_path)
+            source_path = str(pdf_path)
+            doc = self._source_doc(source_path)
             # Track which clients we've already processed from this document
             processed_clients_in_this_doc = set()
             total_pages = len(doc)
             
+            # The reference normally sits in the page header, so only fall
+            # back to the whole page when the header has no match
+            header_texts = self._page_header_texts(doc, pdf_path)
+            
             # Process each page to find client references
             for page_num in range(total_pages):
-                page = doc[page_num]
-                text = page.get_text()
+                page_ref = self._match_manifest_ref(header_texts[page_num])
+                if page_ref is None:
+                    page_ref = self._match_manifest_ref(self._page_text(source_path, page_num))
+                if page_ref is None:
+                    continue
                 
-                # Look for reference patterns in the text
-                ref_patterns = [
-                    r'(\d{3}[-/]\d{3}[-/]\d{3})',  # 000-000-000 or 000/000/000
-                    r'(\d{3}\s+\d{3}\s+\d{3})',   # 000 000 000
-                ]
+                ref_normalized, matched_ref = page_ref
+                client_name = self.manifest[matched_ref]
                 
-                for pattern in ref_patterns:
-                    matches = re.findall(pattern, text)
-                    for match in matches:
-                        # Normalize reference format
-                        ref_normalized = match.replace('-', '/').replace(' ', '/')
-                        
-                        # ENHANCED: Match on first 11 characters to handle suffix variations
-                        ref_base = ref_normalized[:11]  # Get first 11 characters: "000/527/962"
-
-                        # Find matching EDI reference by comparing first 11 characters
-                        matched_ref = None
-                        for edi_ref in self.manifest.keys():
-                            if edi_ref[:11] == ref_base:
-                                matched_ref = edi_ref
-                                break
-
-                        if matched_ref:
-                            client_name = self.manifest[matched_ref]
-                            
-                            if matched_ref not in processed_clients_in_this_doc:
-                                self.logger.info(f"{doc_type}: Found {ref_normalized} -> {matched_ref} - {client_name} on page {page_num + 1}")
-
-                                # Store page info using EDI reference as key (not normalized reference)
-                                if not self.clients[matched_ref]['info']:
-                                    self.clients[matched_ref]['info'] = (matched_ref, client_name)
-
-                                self.clients[matched_ref]['pages'].append({
-                                    'page_num': page_num,
-                                    'doc_type': doc_type,
-                                    'doc_obj': doc
-                                })
-                                
-                                # Mark this client as processed for this document
-                                processed_clients_in_this_doc.add(matched_ref)
-                            else:
-                                self.logger.debug(f"{doc_type}: Skipping duplicate reference {matched_ref} on page {page_num + 1}")
-
-                        break  # Only match once per page
+                if matched_ref not in processed_clients_in_this_doc:
+                    self.logger.info("%s: Found %s -> %s - %s on page %d",
+                                     doc_type, ref_normalized, matched_ref, client_name, page_num + 1)
+
+                    # Store page info using EDI reference as key (not normalized reference)
+                    record = self._client_record(matched_ref)
+                    if not record.info:
+                        record.info = (matched_ref, client_name)
+
+                    doc_type_pages = record.advice if doc_type == 'Advice of Arrivals' else record.bill
+                    doc_type_pages.append((source_path, page_num))
+                    
+                    # Mark this client as processed for this document
+                    processed_clients_in_this_doc.add(matched_ref)
+                else:
+                    self.logger.debug("%s: Skipping duplicate reference %s on page %d", doc_type, matched_ref, page_num + 1)
             
-            return doc
+            return True
             
         except Exception as e:
             self.logger.error(f"Error processing {doc_type} {pdf_path.name}: {e}")
-            return None
+            return False
 
     def process_customer_document_edi_first(self, pdf_path):
         """Process individual customer document using EDI-first matching"""
@@ -418,171 +666,64 @@ class PDFMerger:
 
         # First, try to extract reference from filename
         filename = pdf_path.name
-        ref_match = re.search(r'(\d{3}[-/]\d{3}[-/]\d{3})', filename)
-        
+        ref_match = FILENAME_REF_PATTERN.search(filename)
+        # Slash form, also for mixed separators such as 000-527/962
+        file_ref = ref_match.group(1).replace('-', '/') if ref_match else None
+
+        # A filename reference whose base isn't in the manifest can't belong
+        # to any client, so reject the file without opening it
+        if file_ref and file_ref not in self._manifest_prefix:
+            self.logger.warning(f"Customer document {filename} reference {ref_match.group(1)} is not in EDI manifest - skipping")
+            return False
+
         try:
-            doc = fitz.open(pdf_path)
+            source_path = str(pdf_path)
+            doc = self._source_doc(source_path)
             
-            if ref_match:
-                file_ref = ref_match.group(1).replace('-', '/')
-                
+            if file_ref:
                 # Check if this reference exists in EDI manifest
-                if file_ref in self.manifest:
-                    client_name = self.manifest[file_ref]
+                hit = self._manifest_index.get(file_ref)
+                if hit:
+                    file_ref, client_name = hit
                     self.logger.info(f"Customer Doc: {file_ref} - {client_name} (EDI match)")
                     
                     # Store customer document info
-                    if not self.clients[file_ref]['info']:
-                        self.clients[file_ref]['info'] = (file_ref, client_name)
+                    record = self._client_record(file_ref)
+                    if not record.info:
+                        record.info = (file_ref, client_name)
                     
                     # Add all pages of this document
-                    for page_num in range(len(doc)):
-                        self.clients[file_ref]['pages'].append({
-                            'page_num': page_num,
-                            'doc_type': 'Customer Document',
-                            'doc_obj': doc
-                        })
+                    record.customer.extend((source_path, page_num) for page_num in range(len(doc)))
                     
-                    return doc
+                    return True
             
-            # If filename didn't work, scan document content for EDI references
-            text = ""
-            for page in doc:
-                text += page.get_text()
+            # If filename didn't work, scan document content page by page for
+            # EDI references, stopping at the first page that has one
+            hit = None
+            for page_num in range(len(doc)):
+                hit = self._find_manifest_ref_in_text(self._page_text(source_path, page_num))
+                if hit:
+                    break
             
-            # Look for any EDI reference in the document text
-            for edi_ref in self.manifest.keys():
-                if edi_ref in text or edi_ref.replace('/', '-') in text:
-                    client_name = self.manifest[edi_ref]
-                    self.logger.info(f"Customer Doc: {edi_ref} - {client_name} (EDI content match)")
-                    
-                    if not self.clients[edi_ref]['info']:
-                        self.clients[edi_ref]['info'] = (edi_ref, client_name)
-                    
-                    for page_num in range(len(doc)):
-                        self.clients[edi_ref]['pages'].append({
-                            'page_num': page_num,
-                            'doc_type': 'Customer Document',
-                            'doc_obj': doc
-                        })
-                    
-                    return doc
+            if hit:
+                edi_ref, client_name = hit
+                self.logger.info(f"Customer Doc: {edi_ref} - {client_name} (EDI content match)")
+                
+                record = self._client_record(edi_ref)
+                if not record.info:
+                    record.info = (edi_ref, client_name)
+                
+                record.customer.extend((source_path, page_num) for page_num in range(len(doc)))
+                
+                return True
             
             # Document doesn't match any EDI reference
             self.logger.warning(f"Customer document {pdf_path.name} does not match any EDI reference - skipping")
-            doc.close()
-            return None
-            
-        except Exception as e:
-            self.logger.error(f"Error processing customer document {pdf_path.name}: {e}")
-            return None
-
-    def merge_client_documents(self, client_key, client_data):
-        """Merge all documents for a specific client with optimization and tax scanning"""
-        consignee_ref, full_name = client_data['info']
-        if not consignee_ref:
-            self.logger.error(f"Missing consignee reference for {client_key}")
+            self._close_source_doc(source_path)
             return False
-
-        # If no name, create a default one
-        if not full_name:
-            full_name = f"Client_{consignee_ref.replace('/', '_')}"
-
-        self.logger.info(f"Merging documents for: {consignee_ref} - {full_name}")
-
-        # Group pages by document type
-        advice_pages = []
-        bill_pages = []
-        customer_pages = []
-
-        for page_info in client_data['pages']:
-            if page_info['doc_type'] == 'Advice of Arrivals':
-                advice_pages.append(page_info)
-            elif page_info['doc_type'] == 'Bill of Lading':
-                bill_pages.append(page_info)
-            elif page_info['doc_type'] == 'Customer Document':
-                customer_pages.append(page_info)
-
-        self.logger.info(f"Found: {len(advice_pages)} Advice pages, {len(bill_pages)} Bill pages, {len(customer_pages)} Customer pages")
-
-        # Create merged PDF in correct order: Advice → Bills → Customer
-        merged_doc = fitz.open()  # Create new empty document
-
-        # Add pages in order
-        for page_info in advice_pages:
-            source_doc = page_info['doc_obj']
-            page_num = page_info['page_num']
-            merged_doc.insert_pdf(source_doc, from_page=page_num, to_page=page_num)
-
-        for page_info in bill_pages:
-            source_doc = page_info['doc_obj']
-            page_num = page_info['page_num']
-            merged_doc.insert_pdf(source_doc, from_page=page_num, to_page=page_num)
-
-        for page_info in customer_pages:
-            source_doc = page_info['doc_obj']
-            page_num = page_info['page_num']
-            merged_doc.insert_pdf(source_doc, from_page=page_num, to_page=page_num)
-
-        # Save merged document
-        safe_ref = consignee_ref.replace('/', '_')
-        safe_name = re.sub(r'[<>:"/\\|?*]', '_', full_name)
-        output_filename = f"{safe_ref}_{safe_name}.pdf"
-        output_path = self.output_folder / output_filename
-
-        # NEW: Scan for tax keywords before saving
-        self.scan_for_tax_keywords(merged_doc, full_name, consignee_ref)
-
-        try:
-            # Save the merged document
-            merged_doc.save(output_path)
-            original_size = output_path.stat().st_size / (1024 * 1024)  # MB
-            
-            # Optimize if enabled
-            if self.enable_optimization:
-                self.logger.info(f"Optimizing merged document: {output_filename}")
-                
-                # FIXED: Get the optimization result as a dictionary
-                optimization_result = self.optimizer.optimize_pdf(str(output_path), str(output_path))
-                
-                if optimization_result and optimization_result.get('optimized'):
-                    # Extract the final size from the result dictionary
-                    final_size = optimization_result['final_size_mb']
-                    savings = optimization_result['savings_mb']
-                    
-                    # Update optimization stats
-                    self.optimization_stats['files_optimized'] += 1
-                    self.optimization_stats['total_savings_mb'] += savings
-                    
-                    # Store compression data for reporting
-                    self.compression_report.append({
-                        'filename': output_filename,
-                        'original_size_mb': optimization_result['original_size_mb'],
-                        'final_size_mb': final_size,
-                        'savings_mb': savings
-                    })
-                    
-                    self.logger.info(f"✅ Saved merged document: {output_filename} ({final_size:.2f}MB, saved {savings:.2f}MB)")
-                
-                elif optimization_result:
-                    # File didn't need optimization (already small enough)
-                    final_size = optimization_result['final_size_mb']
-                    self.logger.info(f"✅ Saved merged document: {output_filename} ({final_size:.2f}MB, no optimization needed)")
-                    
-                else:
-                    # Optimization failed
-                    self.logger.warning(f"Optimization failed for {output_filename}, keeping original")
-                    final_size = original_size
-            else:
-                final_size = original_size
-                self.logger.info(f"✅ Saved merged document: {output_filename} ({final_size:.2f}MB)")
             
-            merged_doc.close()
-            return True
-
         except Exception as e:
-            self.logger.error(f"Error saving merged document for {consignee_ref}: {e}")
-            merged_doc.close()
+            self.logger.error(f"Error processing customer document {pdf_path.name}: {e}")
             return False
 
     def process_all_documents(self):
@@ -633,7 +774,7 @@ class PDFMerger:
                 self.logger.info(f"   👥 Customer Document: {pdf_path.name}")
             
             # 4. Fallback for other files with client references
-            elif re.search(r'\d{3}[-/]\d{3}[-/]\d{3}', filename):
+            elif FILENAME_REF_PATTERN.search(filename):
                 customer_files.append(pdf_path)
                 self.logger.info(f"   👥 Customer Document (by reference): {pdf_path.name}")
             
@@ -653,15 +794,14 @@ class PDFMerger:
             self.logger.warning(f"⚠️  Multiple Advice of Arrival files detected: {[f.name for f in advice_files]}")
             self.logger.warning(f"⚠️  Will use only the FIRST file: {advice_files[0].name}")
         
-        opened_docs = []  # Keep track of opened documents
+        documents_processed = 0
         
         # FIXED: Process Advice of Arrival files (ONLY THE FIRST ONE)
         if advice_files:
             advice_file = advice_files[0]  # Take only the first one to prevent duplication
             self.logger.info(f"🔄 Processing single Advice of Arrival: {advice_file.name}")
-            doc = self.process_multi_client_document(advice_file, 'Advice of Arrivals')
-            if doc:
-                opened_docs.append(doc)
+            if self.process_multi_client_document(advice_file, 'Advice of Arrivals'):
+                documents_processed += 1
             
             # Skip any additional advice files
             if len(advice_files) > 1:
@@ -674,28 +814,27 @@ class PDFMerger:
         self.logger.info(f"🔄 Processing {len(bill_files)} Bill of Lading files...")
         for bill_file in bill_files:
             self.logger.info(f"   🚢 Processing: {bill_file.name}")
-            doc = self.process_multi_client_document(bill_file, 'Bill of Lading')
-            if doc:
-                opened_docs.append(doc)
+            if self.process_multi_client_document(bill_file, 'Bill of Lading'):
+                documents_processed += 1
         
         # Process customer documents
         self.logger.info(f"🔄 Processing {len(customer_files)} customer documents...")
         for customer_file in customer_files:
             self.logger.info(f"   👥 Processing: {customer_file.name}")
-            doc = self.process_customer_document_edi_first(customer_file)
-            if doc:
-                opened_docs.append(doc)
+            if self.process_customer_document_edi_first(customer_file):
+                documents_processed += 1
         
         # ENHANCED: Validation before merging
         self.logger.info("🔍 Validating client data before merging...")
         
         total_clients_with_pages = 0
         for edi_ref, edi_name in self.manifest.items():
-            if edi_ref in self.clients and self.clients[edi_ref]['pages']:
+            record = self.clients.get(edi_ref)
+            if record is not None and record.has_pages():
                 # Count pages by type to detect duplication
-                advice_count = len([p for p in self.clients[edi_ref]['pages'] if p['doc_type'] == 'Advice of Arrivals'])
-                bill_count = len([p for p in self.clients[edi_ref]['pages'] if p['doc_type'] == 'Bill of Lading'])
-                customer_count = len([p for p in self.clients[edi_ref]['pages'] if p['doc_type'] == 'Customer Document'])
+                advice_count = len(record.advice)
+                bill_count = len(record.bill)
+                customer_count = len(record.customer)
                 
                 if advice_count > 1:
                     self.logger.warning(f"⚠️  Client {edi_ref} has {advice_count} Advice pages (expected 1)")
@@ -710,29 +849,31 @@ class PDFMerger:
         
         self.logger.info(f"🔄 MERGING DOCUMENTS FOR {len(self.manifest)} EDI CLIENTS")
         
+        clients_to_merge = []
         for edi_ref, edi_name in self.manifest.items():
             # Check if this EDI client has any documents
-            if edi_ref in self.clients and self.clients[edi_ref]['pages']:
+            record = self.clients.get(edi_ref)
+            if record is not None and record.has_pages():
                 self.logger.info(f"🔧 Processing EDI client: {edi_ref} - {edi_name}")
                 
                 # Ensure we use the EDI name as authoritative
-                self.clients[edi_ref]['info'] = (edi_ref, edi_name)
-                
-                success = self.merge_client_documents(edi_ref, self.clients[edi_ref])
-                if success:
-                    edi_clients_processed += 1
+                record.info = (edi_ref, edi_name)
+                clients_to_merge.append((edi_ref, record))
             else:
                 self.logger.warning(f"⚠️  No documents found for EDI client: {edi_ref} - {edi_name}")
         
+        for success in self._merge_clients(clients_to_merge):
+            if success:
+                edi_clients_processed += 1
+        
         # Close all opened documents
         self.logger.info("🔒 Closing all opened documents...")
-        for doc in opened_docs:
-            doc.close()
+        self._text_cache.clear()
+        self._close_source_docs()
         
         # Update average compression ratio
         if self.enable_optimization and self.optimization_stats['files_optimized'] > 0:
-            total_original = sum(item['original_size_mb'] for item in self.compression_report)
-            total_final = sum(item['final_size_mb'] for item in self.compression_report)
+            total_original, total_final = self._compression_totals()
             self.optimization_stats['average_compression_ratio'] = total_original / total_final if total_final > 0 else 1
         
         # Generate and save reports
@@ -749,16 +890,74 @@ class PDFMerger:
         self.logger.info(f"✅ Processing complete!")
         self.logger.info(f"   📁 Output folder: {self.output_folder}")
         self.logger.info(f"   👥 Clients processed: {edi_clients_processed}/{len(self.manifest)}")
-        self.logger.info(f"   📄 Files processed: {len(opened_docs)} documents")
+        self.logger.info(f"   📄 Files processed: {documents_processed} documents")
         
         if len(advice_files) > 1:
             self.logger.info(f"   ⚠️  Note: {len(advice_files)-1} duplicate Advice files were skipped")
 
-    # ALSO ADD THIS ENHANCED LOGGING TO merge_client_documents METHOD:
+    def __getstate__(self):
+        # Open documents cannot be sent to worker processes
+        state = self.__dict__.copy()
+        state['_open_docs'] = OrderedDict()
+        return state
+
+    def _merge_clients(self, clients_to_merge):
+        """Merge every (client_key, client_data) pair, in worker processes when there are several"""
+        workers = min(self.max_workers, len(clients_to_merge))
+        if workers > 1:
+            # Workers open their own copies of the source PDFs
+            self._close_source_docs()
+            # Send clients in batches so large runs don't pay one round trip each
+            chunksize = max(1, len(clients_to_merge) // (workers * 4))
+            # Workers are spawned, never forked: the caller (the GUI's
+            # background thread, the log listener below) may be running threads
+            mp_context = multiprocessing.get_context("spawn")
+            # Worker log records are written by this process's handlers
+            root_logger = logging.getLogger()
+            log_queue = mp_context.Queue()
+            log_listener = QueueListener(log_queue, *root_logger.handlers, respect_handler_level=True)
+            log_listener.start()
+            try:
+                with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context,
+                                         initializer=_init_merge_worker,
+                                         initargs=(self, log_queue, root_logger.level)) as executor:
+                    results = list(executor.map(_merge_client_worker, *zip(*clients_to_merge),
+                                                chunksize=chunksize))
+            except Exception as e:
+                self.logger.warning(f"Parallel merge failed, merging clients one at a time: {e}")
+            else:
+                successes = []
+                for success, compression_entries, tax_alerts in results:
+                    successes.append(success)
+                    self.compression_report.extend(compression_entries)
+                    self.tax_alerts.extend(tax_alerts)
+                    if self.enable_optimization:
+                        self.optimization_stats['files_optimized'] += len(compression_entries)
+                        self.optimization_stats['total_savings_mb'] += sum(item['savings_mb'] for item in compression_entries)
+                return successes
+            finally:
+                log_listener.stop()
+        
+        # Close each source PDF as soon as the last client using it is merged
+        last_use = {}
+        for index, (_, client_data) in enumerate(clients_to_merge):
+            for pages in (client_data.advice, client_data.bill, client_data.customer):
+                for pdf_path, _ in pages:
+                    last_use[pdf_path] = index
+        release_after = {}
+        for pdf_path, index in last_use.items():
+            release_after.setdefault(index, []).append(pdf_path)
+        
+        successes = []
+        for index, (client_key, client_data) in enumerate(clients_to_merge):
+            successes.append(self.merge_client_documents(client_key, client_data))
+            for pdf_path in release_after.get(index, ()):
+                self._close_source_doc(pdf_path)
+        return successes
 
     def merge_client_documents(self, client_key, client_data):
         """Merge all documents for a specific client with enhanced validation"""
-        consignee_ref, full_name = client_data['info']
+        consignee_ref, full_name = client_data.info
         if not consignee_ref:
             self.logger.error(f"Missing consignee reference for {client_key}")
             return False
@@ -769,18 +968,10 @@ class PDFMerger:
 
         self.logger.info(f"🔧 Merging documents for: {consignee_ref} - {full_name}")
 
-        # Group pages by document type
-        advice_pages = []
-        bill_pages = []
-        customer_pages = []
-
-        for page_info in client_data['pages']:
-            if page_info['doc_type'] == 'Advice of Arrivals':
-                advice_pages.append(page_info)
-            elif page_info['doc_type'] == 'Bill of Lading':
-                bill_pages.append(page_info)
-            elif page_info['doc_type'] == 'Customer Document':
-                customer_pages.append(page_info)
+        # Pages are already grouped by document type
+        advice_pages = client_data.advice
+        bill_pages = client_data.bill
+        customer_pages = client_data.customer
 
         # ENHANCED: Detailed logging and validation
         self.logger.info(f"   📊 Page counts: {len(advice_pages)} advice, {len(bill_pages)} bill, {len(customer_pages)} customer")
@@ -794,48 +985,57 @@ class PDFMerger:
         # Create merged PDF in correct order: Advice → Bills → Customer
         merged_doc = fitz.open()  # Create new empty document
 
-        # Add pages in order with logging
-        self.logger.info(f"   📄 Adding {len(advice_pages)} advice pages...")
-        for page_info in advice_pages:
-            source_doc = page_info['doc_obj']
-            page_num = page_info['page_num']
-            merged_doc.insert_pdf(source_doc, from_page=page_num, to_page=page_num)
-
-        self.logger.info(f"   📄 Adding {len(bill_pages)} bill pages...")
-        for page_info in bill_pages:
-            source_doc = page_info['doc_obj']
-            page_num = page_info['page_num']
-            merged_doc.insert_pdf(source_doc, from_page=page_num, to_page=page_num)
-
-        self.logger.info(f"   📄 Adding {len(customer_pages)} customer pages...")
-        for page_info in customer_pages:
-            source_doc = page_info['doc_obj']
-            page_num = page_info['page_num']
-            merged_doc.insert_pdf(source_doc, from_page=page_num, to_page=page_num)
+        # Add pages in order with logging. final=False keeps each source's map
+        # of already copied objects (fonts, images) across runs so shared
+        # resources are copied once; the maps are released with merged_doc
+        self.logger.debug("   📄 Adding %d advice pages...", len(advice_pages))
+        for pdf_path, from_page, to_page in page_runs(advice_pages):
+            merged_doc.insert_pdf(self._source_doc(pdf_path), from_page=from_page, to_page=to_page, final=False)
+
+        self.logger.debug("   📄 Adding %d bill pages...", len(bill_pages))
+        for pdf_path, from_page, to_page in page_runs(bill_pages):
+            merged_doc.insert_pdf(self._source_doc(pdf_path), from_page=from_page, to_page=to_page, final=False)
+
+        self.logger.debug("   📄 Adding %d customer pages...", len(customer_pages))
+        for pdf_path, from_page, to_page in page_runs(customer_pages):
+            merged_doc.insert_pdf(self._source_doc(pdf_path), from_page=from_page, to_page=to_page, final=False)
+
+        self.logger.info(f"   📄 Inserted {len(merged_doc)} pages for {consignee_ref}")
 
         # Continue with the rest of the existing merge_client_documents logic...
         # (Save merged document, optimization, etc. - keep existing code)
         
         # Save merged document
         safe_ref = consignee_ref.replace('/', '_')
-        safe_name = re.sub(r'[<>:"/\\|?*]', '_', full_name)
+        safe_name = UNSAFE_FILENAME_PATTERN.sub('_', full_name)
         output_filename = f"{safe_ref}_{safe_name}.pdf"
         output_path = self.output_folder / output_filename
 
         # Scan for tax keywords before saving
-        self.scan_for_tax_keywords(merged_doc, full_name, consignee_ref)
+        self.scan_for_tax_keywords(advice_pages + bill_pages + customer_pages, full_name, consignee_ref)
 
         try:
-            # Save the merged document
-            merged_doc.save(output_path)
-            original_size = output_path.stat().st_size / (1024 * 1024)  # MB
+            # Serialize the merged document in memory (unused objects removed,
+            # streams, images and fonts compressed, objects packed into object
+            # streams) so the output file is only written once; this alone
+            # often gets under the optimizer's target
+            pdf_bytes = merged_doc.tobytes(garbage=4, deflate=True, deflate_images=True,
+                                           deflate_fonts=True, clean=True, use_objstms=1)
+            original_size = len(pdf_bytes) / (1024 * 1024)  # MB
             
             # Optimize if enabled
             if self.enable_optimization:
                 self.logger.info(f"   🗜️  Optimizing: {output_filename}")
                 
-                # Get the optimization result as a dictionary
-                optimization_result = self.optimizer.optimize_pdf(str(output_path), str(output_path))
+                # Get the optimized bytes and the optimization result as a dictionary
+                # (merged_doc is optimized in place rather than re-parsed)
+                try:
+                    pdf_bytes, optimization_result = self.optimizer.optimize_bytes(pdf_bytes, output_filename,
+                                                                                   doc=merged_doc)
+                except Exception:
+                    optimization_result = None  # Logged by the optimizer
+                
+                output_path.write_bytes(pdf_bytes)
                 
                 if optimization_result and optimization_result.get('optimized'):
                     # Extract the final size from the result dictionary
@@ -866,6 +1066,7 @@ class PDFMerger:
                     self.logger.warning(f"   ⚠️  Optimization failed for {output_filename}, keeping original")
                     final_size = original_size
             else:
+                output_path.write_bytes(pdf_bytes)
                 final_size = original_size
                 self.logger.info(f"   ✅ Saved: {output_filename} ({final_size:.2f}MB)")
             
@@ -894,6 +1095,9 @@ def parse_command_line():
                     help='Reference PDF document to extract client manifest')
     parser.add_argument('--manifest-file',
                     help='Existing CSV manifest file')
+    parser.add_argument('--header-clip',
+                    help='Page region "x0,y0,x1,y1" (points) holding the client reference '
+                         'on Advice/Bill pages (default: first text blocks)')
     
     # Optimization options
     parser.add_argument('--enable-optimization', action='store_true', default=True,
@@ -904,6 +1108,8 @@ def parse_command_line():
                     help='Target file size in MB (default: 1.2)')
     parser.add_argument('--quality', type=int, default=85,
                     help='Image quality 0-100 (default: 85)')
+    parser.add_argument('--workers', type=int, default=1,
+                    help='Worker processes for merging clients (default: 1, merge in this process)')
     
     # Optional settings
     parser.add_argument('--job-id',
@@ -939,13 +1145,18 @@ if __name__ == "__main__":
             edi_file=args.edi_file,
             reference_doc=args.reference_doc,
             enable_optimization=enable_optimization,
-            target_size_mb=args.target_size
+            target_size_mb=args.target_size,
+            header_clip=[float(v) for v in args.header_clip.split(',')] if args.header_clip else None,
+            max_workers=args.workers
         )
         
-        # Load manifest file if specified
+        # Load manifest file if specified (an EDI manifest takes priority)
         if args.manifest_file:
-            logger.info(f"Loading manifest file: {args.manifest_file}")
-            pdf_merger.load_manifest(args.manifest_file)
+            if args.edi_file and pdf_merger.manifest:
+                logger.info(f"Skipping manifest file {args.manifest_file} - EDI manifest already loaded")
+            else:
+                logger.info(f"Loading manifest file: {args.manifest_file}")
+                pdf_merger.load_manifest(args.manifest_file)
         
         # Process documents
         logger.info("Starting document processing")
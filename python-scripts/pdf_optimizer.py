@@ -1,20 +1,87 @@
 import fitz  # PyMuPDF
+import os
+import hashlib
+import shutil
 import logging
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+
+# For faster JPEG encoding via libjpeg-turbo (falls back to Pillow)
+try:
+    import numpy as np
+    from turbojpeg import (TurboJPEG, TJPF_RGB, TJPF_GRAY, TJFLAG_PROGRESSIVE,
+                           TJSAMP_444, TJSAMP_422, TJSAMP_420, TJSAMP_GRAY)
+    _turbo_jpeg = TurboJPEG()
+    TURBOJPEG_SUBSAMPLING = {'4:4:4': TJSAMP_444, '4:2:2': TJSAMP_422, '4:2:0': TJSAMP_420}
+    TURBOJPEG_AVAILABLE = True
+except (ImportError, OSError, RuntimeError):  # RuntimeError: libturbojpeg not found
+    TURBOJPEG_AVAILABLE = False
+
+# For lossless JPEG recompression (Huffman optimization, progressive scans)
+try:
+    import mozjpeg_lossless_optimization
+    MOZJPEG_LOSSLESS_AVAILABLE = True
+except ImportError:
+    MOZJPEG_LOSSLESS_AVAILABLE = False
+
+# Sum of the IJG standard luminance quantization table, used to estimate the
+# quality an embedded JPEG was saved with
+IJG_LUMINANCE_TABLE_SUM = 3688
+
+# Pillow formats extract_image can return (others, e.g. JBIG2, are left as is);
+# limiting Image.open to these skips probing and importing every other plugin
+IMAGE_FORMATS = ('JPEG', 'PNG', 'JPEG2000', 'TIFF')
+
+# Only images larger than this (in bytes) are recompressed
+MIN_IMAGE_BYTES = 50000
+
+# Upper bound on threads recompressing images within one document
+MAX_IMAGE_WORKERS = min(8, os.cpu_count() or 1)
+# Large images extracted before each recompress-and-replace round
+IMAGE_BATCH_SIZE = 2 * MAX_IMAGE_WORKERS
+
+# Lower JPEG qualities tried, in order, while a document stays over target
+RETRY_QUALITIES = (65, 55, 45)
+
+# Images where one brightness band (of 16) covers at least this share of
+# pixels are flat (scanned text, backgrounds, charts) and are encoded at no
+# more than FLAT_IMAGE_QUALITY
+FLAT_IMAGE_DOMINANT_SHARE = 0.6
+FLAT_IMAGE_QUALITY = 55
+
+# Longest side of the preview the histogram is taken from
+DETAIL_SAMPLE_SIZE = 256
+
+# Grayscale images with at least this share of pixels near black (< 64) or
+# near white (>= 192), and at least BILEVEL_MIN_END_SHARE at each end, are
+# black-and-white scans, stored as 1-bit instead of JPEG
+BILEVEL_MIN_SHARE = 0.95
+BILEVEL_MIN_END_SHARE = 0.02
+
+# Longest side of the reduced-scale JPEG decode the bilevel test measures
+BILEVEL_SAMPLE_SIZE = 1024
 
 
 class PDFOptimizer:
-    def __init__(self, target_size_mb=1.2, quality=85):
+    def __init__(self, target_size_mb=1.2, quality=75, max_image_dimension=1600,
+                 progressive=True, subsampling='4:2:0'):
         """
         Initialize PDF Optimizer
         
         Args:
             target_size_mb (float): Target file size in MB
             quality (int): Image quality 0-100
+            max_image_dimension (int): Longest side in pixels of recompressed images (None keeps full size)
+            progressive (bool): Write progressive JPEGs (usually smaller than baseline)
+            subsampling (str): JPEG chroma subsampling, '4:4:4', '4:2:2' or '4:2:0'
         """
         self.target_size_mb = target_size_mb
         self.target_size_bytes = target_size_mb * 1024 * 1024
         self.quality = quality
+        self.max_image_dimension = max_image_dimension
+        self.progressive = progressive
+        self.subsampling = subsampling
         self.logger = logging.getLogger('PDFOptimizer')
     
     def optimize_pdf(self, input_path, output_path=None):
@@ -36,7 +103,9 @@ class PDFOptimizer:
         if original_size <= self.target_size_bytes:
             # File already under target size
             if output_path != input_path:
-                output_path.write_bytes(input_path.read_bytes())
+                # Kernel-side copy (copy_file_range/sendfile) instead of a
+                # round trip through Python bytes
+                shutil.copyfile(input_path, output_path)
             
             self.logger.info(f"PDF already optimized: {input_path.name} ({original_size / (1024*1024):.2f}MB)")
             
@@ -52,39 +121,138 @@ class PDFOptimizer:
         try:
             self.logger.info(f"Optimizing PDF: {input_path.name} ({original_size / (1024*1024):.2f}MB)")
             
-            # Open PDF document
-            doc = fitz.open(input_path)
+            # Open PDF document from memory so the output can safely replace
+            # the input file without a temporary copy
+            source_bytes = input_path.read_bytes()
+            doc = fitz.open(stream=source_bytes, filetype="pdf")
             
-            # Apply optimization strategies
-            optimization_steps = self._optimize_document(doc)
+            try:
+                # Lossless recompression inside MuPDF comes first; the PIL image
+                # pass only runs when that alone doesn't reach the target size
+                pdf_bytes = self._serialize(doc)
+                if len(pdf_bytes) <= self.target_size_bytes:
+                    optimization_steps = ["Deflated streams, images and fonts"]
+                else:
+                    pdf_bytes, optimization_steps = self._optimize_to_target(doc, source_bytes)
+            finally:
+                doc.close()
             
-            # FIX: Use a temporary file instead of overwriting the original
-            temp_path = output_path.with_suffix('.temp.pdf')
+            # Write the result with a single save
+            output_path.write_bytes(pdf_bytes)
+            final_size = len(pdf_bytes)
             
-            # Save optimized PDF with compression settings
-            doc.save(str(temp_path), 
-                    garbage=4,      # Remove unused objects
-                    deflate=True,   # Compress streams
-                    clean=True,     # Clean up document
-                    linear=False,    # Linearization not supported in newer PyMuPDF
-                    pretty=False)   # Don't pretty-print (saves space)
+            # Calculate results
+            compression_ratio = original_size / final_size if final_size > 0 else 1
+            savings_mb = (original_size - final_size) / (1024 * 1024)
             
-            doc.close()
+            self.logger.info(f"Optimization complete: {final_size / (1024*1024):.2f}MB (saved {savings_mb:.2f}MB)")
+            
+            return {
+                'optimized': True,
+                'original_size_mb': original_size / (1024 * 1024),
+                'final_size_mb': final_size / (1024 * 1024),
+                'compression_ratio': compression_ratio,
+                'savings_mb': savings_mb,
+                'target_achieved': final_size <= self.target_size_bytes,
+                'optimization_steps': optimization_steps
+            }
+            
+        except Exception as e:
+            self.logger.error(f"PDF optimization failed: {str(e)}")
+            raise Exception(f"PDF optimization failed: {str(e)}")
+    
+    def _optimize_to_target(self, doc, source_bytes=None):
+        """
+        Optimize doc in place and serialize it; while the result is over the
+        target size, start again from source_bytes at the next lower image quality
+        
+        Returns (pdf_bytes, optimization_steps)
+        """
+        # Apply optimization strategies
+        optimization_steps = self._optimize_document(doc)
+        pdf_bytes = self._serialize(doc)
+        
+        if source_bytes is None:
+            return pdf_bytes, optimization_steps
+        
+        for quality in RETRY_QUALITIES:
+            if len(pdf_bytes) <= self.target_size_bytes:
+                break
+            if quality >= self.quality:
+                continue
             
-            # Replace original with optimized version
-            if temp_path.exists():
-                temp_path.replace(output_path)
+            # Re-encode from the source images, not the already recompressed ones
+            retry_doc = fitz.open(stream=source_bytes, filetype="pdf")
+            try:
+                retry_steps = self._optimize_document(retry_doc, quality)
+                retry_bytes = self._serialize(retry_doc)
+            finally:
+                retry_doc.close()
             
-            # Check final size
-            final_size = output_path.stat().st_size
+            if len(retry_bytes) >= len(pdf_bytes):
+                break  # Image quality no longer makes a difference
             
-            # Calculate results
+            self.logger.info(f"Lowered image quality to {quality}: {len(retry_bytes) / (1024*1024):.2f}MB")
+            pdf_bytes = retry_bytes
+            optimization_steps = retry_steps + [f"Lowered image quality to {quality}"]
+        
+        return pdf_bytes, optimization_steps
+    
+    def _serialize(self, doc):
+        """Serialize a document with compression settings"""
+        return doc.tobytes(garbage=4,             # Remove unused objects
+                           deflate=True,          # Compress streams
+                           deflate_images=True,   # Compress uncompressed images
+                           deflate_fonts=True,    # Compress uncompressed fonts
+                           clean=True,            # Clean up document
+                           use_objstms=1,         # Pack objects into compressed object streams
+                           pretty=False)          # Don't pretty-print (saves space)
+    
+    def optimize_bytes(self, pdf_bytes, name='document', doc=None):
+        """
+        Optimize an in-memory PDF without writing it to disk
+        
+        doc may be the open document pdf_bytes was serialized from; it is then
+        optimized in place instead of parsing pdf_bytes again (the caller
+        still owns and closes it)
+        
+        Returns (pdf_bytes, result) where result has the same keys as optimize_pdf
+        """
+        original_size = len(pdf_bytes)
+        
+        if original_size <= self.target_size_bytes:
+            # Document already under target size
+            self.logger.info(f"PDF already optimized: {name} ({original_size / (1024*1024):.2f}MB)")
+            
+            return pdf_bytes, {
+                'optimized': False,
+                'reason': 'File already under target size',
+                'original_size_mb': original_size / (1024 * 1024),
+                'final_size_mb': original_size / (1024 * 1024),
+                'compression_ratio': 1.0,
+                'savings_mb': 0
+            }
+        
+        try:
+            self.logger.info(f"Optimizing PDF: {name} ({original_size / (1024*1024):.2f}MB)")
+            
+            owns_doc = doc is None
+            if owns_doc:
+                doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+            
+            try:
+                optimized_bytes, optimization_steps = self._optimize_to_target(doc, pdf_bytes)
+            finally:
+                if owns_doc:
+                    doc.close()
+            
+            final_size = len(optimized_bytes)
             compression_ratio = original_size / final_size if final_size > 0 else 1
             savings_mb = (original_size - final_size) / (1024 * 1024)
             
             self.logger.info(f"Optimization complete: {final_size / (1024*1024):.2f}MB (saved {savings_mb:.2f}MB)")
             
-            return {
+            return optimized_bytes, {
                 'optimized': True,
                 'original_size_mb': original_size / (1024 * 1024),
                 'final_size_mb': final_size / (1024 * 1024),
@@ -98,53 +266,97 @@ class PDFOptimizer:
             self.logger.error(f"PDF optimization failed: {str(e)}")
             raise Exception(f"PDF optimization failed: {str(e)}")
     
-    def _optimize_document(self, doc):
+    def _optimize_document(self, doc, quality=None):
         """
         Apply various optimization strategies to the document
+        
+        quality overrides self.quality for recompressed images
         """
         optimization_steps = []
         
         try:
             # Step 1: Image optimization
-            image_count = 0
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-                image_list = page.get_images()
-                
-                for img_index, img in enumerate(image_list):
-                    try:
-                        # Extract image
+            # Images shared across pages (logos, letterheads) have one xref, so
+            # each is extracted and replaced once for every page using it.
+            # Large images are handled in bounded batches so image-heavy
+            # documents never hold every extracted image in memory at once.
+            # Merged documents also embed the same image under separate xrefs,
+            # so those are recognised by content and recompressed only once
+            seen_xrefs = set()
+            image_hashes = {}  # (content digest, smask xref) -> first xref
+            duplicates = []  # (first xref, duplicate xref)
+            replaced_xrefs = set()
+            total_image_refs = 0
+            batch = []  # (page_num, xref, image_bytes, smask xref)
+            with ThreadPoolExecutor(max_workers=MAX_IMAGE_WORKERS) as executor:
+                for page in doc:
+                    image_list = page.get_images()
+                    total_image_refs += len(image_list)
+                    
+                    for img_index, img in enumerate(image_list):
                         xref = img[0]
-                        base_image = doc.extract_image(xref)
-                        image_bytes = base_image["image"]
+                        if xref in seen_xrefs:
+                            continue
+                        seen_xrefs.add(xref)
                         
-                        # Only compress if image is large
-                        if len(image_bytes) > 50000:  # 50KB threshold
-                            # Replace with compressed version
-                            compressed_image = self._compress_image_bytes(image_bytes)
-                            if compressed_image and len(compressed_image) < len(image_bytes):
-                                # Replace the image in the document
-                                doc._replace_image(xref, compressed_image)
-                                image_count += 1
-                    except Exception as img_error:
-                        self.logger.debug(f"Could not optimize image {img_index}: {img_error}")
-                        continue
+                        try:
+                            # Skip small images by their stored stream length
+                            # rather than decoding them with extract_image
+                            length_type, length = doc.xref_get_key(xref, "Length")
+                            if length_type == "int" and int(length) <= MIN_IMAGE_BYTES:
+                                continue
+                            
+                            # Stencil masks and color-key masked images can't
+                            # be stored as JPEG without losing their transparency
+                            if (doc.xref_get_key(xref, "ImageMask")[1] == "true"
+                                    or doc.xref_get_key(xref, "Mask")[0] != "null"):
+                                continue
+                            
+                            # Extract image
+                            base_image = doc.extract_image(xref)
+                            image_bytes = base_image["image"]
+                            
+                            # Only compress if image is large
+                            if len(image_bytes) > MIN_IMAGE_BYTES:
+                                smask = base_image.get("smask", 0)
+                                key = (hashlib.blake2b(image_bytes, digest_size=16).digest(), smask)
+                                if key in image_hashes:
+                                    duplicates.append((image_hashes[key], xref))
+                                else:
+                                    image_hashes[key] = xref
+                                    batch.append((page.number, xref, image_bytes, smask))
+                        except Exception as img_error:
+                            self.logger.debug("Could not optimize image %d: %s", img_index, img_error)
+                            continue
+                    
+                    if len(batch) >= IMAGE_BATCH_SIZE:
+                        replaced_xrefs |= self._replace_images(doc, executor, batch, quality)
+                        batch = []
+                
+                replaced_xrefs |= self._replace_images(doc, executor, batch, quality)
+            image_count = len(replaced_xrefs)
+            
+            # Point duplicates at their recompressed first copy
+            for first_xref, xref in duplicates:
+                if first_xref in replaced_xrefs:
+                    doc.xref_copy(first_xref, xref)
+                    image_count += 1
+            
+            self.logger.debug("Unique image xrefs: %d of %d, %d duplicated by content",
+                              len(seen_xrefs), total_image_refs, len(duplicates))
             
             if image_count > 0:
                 optimization_steps.append(f"Compressed {image_count} images")
             
             # Step 2: Font optimization
-            font_count = 0
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-                # Remove unused fonts (handled by garbage collection)
-                font_count += 1
-            
+            # Unused fonts are removed by garbage collection when saving
             optimization_steps.append("Applied font optimization")
             
             # Step 3: Remove metadata and annotations
-            # Clear metadata
-            doc.set_metadata({})
+            # Drop the XMP stream and unlink the Info dictionary from the
+            # trailer; garbage collection removes the orphaned objects on save
+            doc.del_xml_metadata()
+            doc.xref_set_key(-1, "Info", "null")
             optimization_steps.append("Removed metadata")
             
             return optimization_steps
@@ -153,24 +365,158 @@ class PDFOptimizer:
             self.logger.warning(f"Some optimization steps failed: {e}")
             return optimization_steps or ["Basic compression applied"]
     
-    def _compress_image_bytes(self, image_bytes):
+    def _replace_images(self, doc, executor, images, quality=None):
+        """
+        Recompress a batch of (page_num, xref, image_bytes, smask) and swap in the smaller results
+        
+        PIL releases the GIL while decoding and encoding, so images are
+        recompressed in the executor's threads; MuPDF is not thread-safe, so
+        the replacements stay on this thread
+        
+        Returns the set of replaced xrefs
+        """
+        replaced = set()
+        if not images:
+            return replaced
+        
+        compressed_images = executor.map(self._compress_image_bytes,
+                                         [image_bytes for _, _, image_bytes, _ in images], repeat(quality))
+        for (page_num, xref, image_bytes, smask), compressed_image in zip(images, compressed_images):
+            if compressed_image and len(compressed_image) < len(image_bytes):
+                try:
+                    # Replace the image object itself
+                    doc[page_num].replace_image(xref, stream=compressed_image)
+                    # replace_image writes /SMask null; the recompressed image
+                    # is the opaque base, so reattach its original soft mask
+                    if smask:
+                        doc.xref_set_key(xref, "SMask", f"{smask} 0 R")
+                    replaced.add(xref)
+                except Exception as img_error:
+                    self.logger.debug("Could not replace image xref %d: %s", xref, img_error)
+        
+        # Release MuPDF's cached decoded objects before the next batch
+        fitz.TOOLS.store_shrink(100)
+        return replaced
+    
+    def _is_oversized(self, size):
+        """Whether an image (width, height) exceeds max_image_dimension"""
+        return bool(self.max_image_dimension) and max(size) > self.max_image_dimension
+    
+    def _bilevel_threshold(self, img, image_bytes):
+        """
+        Gray level separating black from white if an image is black and white
+        (or nearly so), like a text scan; None otherwise
+        """
+        from PIL import Image, ImageChops
+        from io import BytesIO
+        
+        if img.mode == '1':
+            return 128
+        if img.mode not in ('RGB', 'L'):
+            return None
+        
+        # Measure a separately opened JPEG decoded at reduced scale, so img
+        # itself isn't loaded and can still be drafted afterwards. Decoded
+        # color JPEGs are never exactly gray, so only grayscale ones qualify
+        sample = img
+        if img.format == 'JPEG':
+            if img.mode != 'L':
+                return None
+            scale = BILEVEL_SAMPLE_SIZE / max(img.size)
+            sample = Image.open(BytesIO(image_bytes), formats=('JPEG',))
+            sample.draft('L', (int(img.width * scale), int(img.height * scale)))
+        
+        if sample.mode == 'RGB':
+            # Gray images with an ICC color space are often extracted as RGB
+            red, green, blue = sample.split()
+            if ImageChops.difference(red, green).getbbox() or ImageChops.difference(red, blue).getbbox():
+                return None
+            sample = red
+        
+        # Both ends must be present: an image that is all light (faint text)
+        # or all dark (a dark photo) would lose everything to a threshold
+        histogram = sample.histogram()
+        total = sum(histogram)
+        dark = sum(histogram[:64])
+        light = sum(histogram[192:])
+        if (dark < BILEVEL_MIN_END_SHARE * total or light < BILEVEL_MIN_END_SHARE * total
+                or dark + light < BILEVEL_MIN_SHARE * total):
+            return None
+        
+        # Split halfway between the most common dark and light levels
+        dark_peak = max(range(64), key=histogram.__getitem__)
+        light_peak = max(range(192, 256), key=histogram.__getitem__)
+        return (dark_peak + light_peak + 1) // 2
+    
+    def _is_flat(self, img):
+        """Whether an image has too little detail to need a high JPEG quality"""
+        sample = img.convert('L')
+        sample.thumbnail((DETAIL_SAMPLE_SIZE, DETAIL_SAMPLE_SIZE))
+        histogram = sample.histogram()
+        bands = [sum(histogram[i:i + 16]) for i in range(0, 256, 16)]
+        return max(bands) >= FLAT_IMAGE_DOMINANT_SHARE * sum(bands)
+    
+    def _compress_image_bytes(self, image_bytes, quality=None):
         """
-        Compress image bytes using PIL if available
+        Compress image bytes using PIL if available (quality defaults to self.quality)
         """
+        quality = quality or self.quality
+        
         try:
             from PIL import Image
             from io import BytesIO
             
             # Open image
-            img = Image.open(BytesIO(image_bytes))
+            img = Image.open(BytesIO(image_bytes), formats=IMAGE_FORMATS)
+            
+            # Black-and-white scans are far smaller as 1-bit (Flate-compressed
+            # in the PDF) than any JPEG, and stay sharp at full resolution
+            threshold = self._bilevel_threshold(img, image_bytes)
+            if threshold is not None:
+                if img.mode != '1':
+                    img = img.convert('L').point(lambda level: 255 if level >= threshold else 0, '1')
+                output = BytesIO()
+                img.save(output, format='PNG', optimize=True)
+                return output.getvalue()
+            
+            # Re-encoding a JPEG that is already small enough and at or below
+            # the target quality only loses detail, so at most rewrite it losslessly
+            if (img.format == 'JPEG' and not self._is_oversized(img.size)
+                    and estimate_jpeg_quality(img) <= quality):
+                if MOZJPEG_LOSSLESS_AVAILABLE:
+                    return mozjpeg_lossless_optimization.optimize(image_bytes)
+                return None
+            
+            if self.max_image_dimension:
+                # Let libjpeg decode large JPEGs at a reduced scale instead of
+                # decoding at full size and shrinking afterwards
+                img.draft('RGB', (self.max_image_dimension, self.max_image_dimension))
             
             # Convert to RGB if necessary
             if img.mode in ('RGBA', 'LA', 'P'):
                 img = img.convert('RGB')
             
-            # Compress image
+            if self.max_image_dimension:
+                # Shrink whatever is still oversized (non-JPEG images, or the
+                # remainder after draft's power-of-two scaling)
+                img.thumbnail((self.max_image_dimension, self.max_image_dimension), Image.LANCZOS)
+            
+            if self._is_flat(img):
+                quality = min(quality, FLAT_IMAGE_QUALITY)
+            
+            # Compress image (ICC profiles and EXIF are not carried over, so
+            # the output holds pixels only)
+            if TURBOJPEG_AVAILABLE and img.mode in ('RGB', 'L'):
+                flags = TJFLAG_PROGRESSIVE if self.progressive else 0
+                if img.mode == 'RGB':
+                    return _turbo_jpeg.encode(np.asarray(img), quality=quality, pixel_format=TJPF_RGB,
+                                              jpeg_subsample=TURBOJPEG_SUBSAMPLING[self.subsampling], flags=flags)
+                return _turbo_jpeg.encode(np.asarray(img), quality=quality, pixel_format=TJPF_GRAY,
+                                          jpeg_subsample=TJSAMP_GRAY, flags=flags)
+            
             output = BytesIO()
-            img.save(output, format='JPEG', quality=self.quality, optimize=True)
+            img.save(output, format='JPEG', quality=quality, optimize=True,
+                     progressive=self.progressive, subsampling=self.subsampling)
             compressed_bytes = output.getvalue()
             
             return compressed_bytes
@@ -179,7 +525,7 @@ class PDFOptimizer:
             self.logger.debug("PIL not available for image compression")
             return None
         except Exception as e:
-            self.logger.debug(f"Image compression failed: {e}")
+            self.logger.debug("Image compression failed: %s", e)
             return None
     
     def get_pdf_info(self, pdf_path):
@@ -200,12 +546,16 @@ class PDFOptimizer:
                 'needs_optimization': pdf_path.stat().st_size > self.target_size_bytes
             }
             
-            # Count images
-            total_images = 0
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-                images = page.get_images()
-                total_images += len(images)
+            # Count embedded images (each counted once however many pages
+            # show it) from the xref table instead of walking every page
+            image_xrefs = {xref for xref in range(1, doc.xref_length())
+                           if doc.xref_get_key(xref, "Subtype") == ("name", "/Image")}
+            soft_masks = set()
+            for xref in image_xrefs:
+                smask_type, smask = doc.xref_get_key(xref, "SMask")
+                if smask_type == "xref":
+                    soft_masks.add(int(smask.split()[0]))
+            total_images = len(image_xrefs - soft_masks)
             
             info['has_images'] = total_images > 0
             info['image_count'] = total_images
@@ -218,8 +568,18 @@ class PDFOptimizer:
             return None
 
 
+def estimate_jpeg_quality(img):
+    """
+    Estimate the 0-100 quality an opened PIL JPEG was saved with, from its
+    luminance quantization table (assumes IJG-style scaled tables)
+    """
+    scale = sum(img.quantization[0]) * 100 / IJG_LUMINANCE_TABLE_SUM
+    quality = (200 - scale) / 2 if scale <= 100 else 5000 / scale
+    return round(quality)
+
+
 # For backwards compatibility and testing
-def optimize_pdf_file(input_path, output_path=None, target_size_mb=1.2, quality=85):
+def optimize_pdf_file(input_path, output_path=None, target_size_mb=1.2, quality=75):
     """
     Standalone function to optimize a PDF file
     """
@@ -227,17 +587,58 @@ def optimize_pdf_file(input_path, output_path=None, target_size_mb=1.2, quality=
     return optimizer.optimize_pdf(input_path, output_path)
 
 
+def _optimize_pdf_worker(input_path, output_path, target_size_mb, quality):
+    """Process pool entry point: optimize one PDF, reporting failure instead of raising"""
+    try:
+        return optimize_pdf_file(input_path, output_path, target_size_mb, quality)
+    except Exception as e:
+        return {'optimized': False, 'error': str(e)}
+
+
+def optimize_pdf_batch(input_paths, output_dir=None, target_size_mb=1.2, quality=75, workers=None):
+    """
+    Optimize many PDF files in a pool of worker processes
+    
+    Each worker imports PyMuPDF and Pillow once and then handles many files.
+    Files are optimized in place unless output_dir is given. Returns one
+    result per input path, in order; failed files have an 'error' entry
+    """
+    input_paths = [Path(path) for path in input_paths]
+    if not input_paths:
+        return []
+    
+    if output_dir is None:
+        output_paths = [None] * len(input_paths)
+    else:
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        output_paths = [output_dir / path.name for path in input_paths]
+    
+    workers = min(workers or os.cpu_count() or 1, len(input_paths))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_optimize_pdf_worker, input_paths, output_paths,
+                                 repeat(target_size_mb), repeat(quality)))
+
+
 if __name__ == "__main__":
     # Simple test/demo
     import sys
     
     if len(sys.argv) < 2:
         print("Usage: python pdf_optimizer.py <input_pdf> [output_pdf]")
+        print("       python pdf_optimizer.py <input_dir> [output_dir]")
         sys.exit(1)
     
     input_file = sys.argv[1]
     output_file = sys.argv[2] if len(sys.argv) > 2 else None
     
+    if Path(input_file).is_dir():
+        pdf_files = sorted(Path(input_file).glob('*.pdf'))
+        results = optimize_pdf_batch(pdf_files, output_file)
+        for pdf_file, result in zip(pdf_files, results):
+            print(f"{pdf_file.name}: {result}")
+        sys.exit(1 if any('error' in result for result in results) else 0)
+    
     try:
         result = optimize_pdf_file(input_file, output_file)
         print(f"Optimization result: {result}")